@@ -3,14 +3,31 @@ E-commerce Analytics REST API
 Provides endpoints for customer analytics, RFM, conversion funnel, and cohort analysis
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request
 from flask_cors import CORS
+from werkzeug.exceptions import BadRequest, HTTPException
+from flask_caching import Cache
+from cachetools import TTLCache, cached
+from cachetools.keys import hashkey
+from apscheduler.schedulers.background import BackgroundScheduler
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+)
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
+import pyarrow as pa
+from datetime import date, datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+from urllib.parse import urlencode
+import gzip
+import hashlib
+import time
+import orjson
 import logging
 import sys
 import os
+import threading
 
 # Add parent directory to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -19,29 +36,352 @@ from src.ecommerce_etl import EcommerceETL
 app = Flask(__name__)
 CORS(app)
 
+# Response cache (Redis when REDIS_URL is set, in-process otherwise)
+REDIS_URL = os.getenv('REDIS_URL')
+cache = Cache(app, config={
+    'CACHE_TYPE': 'RedisCache' if REDIS_URL else 'SimpleCache',
+    'CACHE_REDIS_URL': REDIS_URL,
+    'CACHE_DEFAULT_TIMEOUT': 60
+})
+
+# Cache TTL policies (seconds)
+CACHE_TTL_SHORT = 30
+CACHE_TTL_NORMAL = 60
+CACHE_TTL_LONG = 300
+CACHE_TTL_STALE = 86400
+CACHE_TTL_WARM = 900
+
+# Background cache warmer interval (minutes)
+CACHE_WARM_INTERVAL_MINUTES = int(os.getenv('CACHE_WARM_INTERVAL_MINUTES', 10))
+WARM_LOCK_KEY = 'warm/lock'
+
+# Endpoints wrapped by cached_endpoint, precomputed by the cache warmer
+CACHED_ENDPOINTS = []
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Request metrics, exposed on /metrics
+REQUEST_LATENCY = Histogram(
+    'api_request_duration_seconds', 'Analytics API request latency', ['endpoint']
+)
+REQUEST_ERRORS = Counter(
+    'api_request_errors_total', 'Analytics API requests that failed', ['endpoint']
+)
+
 # Initialize ETL
 config = {
-    'batch_size': 10000,
+    'batch_size': 100000,
     'snowflake_account': os.getenv('SNOWFLAKE_ACCOUNT', 'your_account'),
     'database': 'ecommerce_analytics'
 }
 etl = EcommerceETL(config)
 
+# Per-process memo of extracted frames, shared by all handlers.
+# Cached frames are shared between requests and must be treated as read-only.
+_frame_cache = TTLCache(maxsize=32, ttl=60)
+_frame_cache_lock = threading.Lock()
+
+
+@cached(_frame_cache, key=partial(hashkey, 'orders'), lock=_frame_cache_lock)
+def _cached_extract_orders(start_date: str, end_date: str) -> pd.DataFrame:
+    """Extract orders once per date range and TTL window"""
+    return etl.extract_orders(start_date, end_date)
+
+
+@cached(_frame_cache, key=partial(hashkey, 'events'), lock=_frame_cache_lock)
+def _cached_extract_events(start_date: str, end_date: str) -> pd.DataFrame:
+    """Extract web events once per date range and TTL window"""
+    return etl.extract_web_events(start_date, end_date)
+
+
+@cached(_frame_cache, key=partial(hashkey, 'rfm'), lock=_frame_cache_lock)
+def _cached_rfm(start_date: str, end_date: str, segment: str = None) -> tuple:
+    """Calculate the RFM top customers and distribution once per TTL window"""
+    return etl.calculate_rfm_top_and_dist(
+        _cached_extract_orders(start_date, end_date), limit=10, segment=segment
+    )
+
+
+def _json_default(obj):
+    """Serialize values orjson does not handle natively"""
+    if isinstance(obj, pd.Timestamp):
+        # isoformat keeps nanoseconds; naive values get the same +00:00 as OPT_NAIVE_UTC
+        return (obj.tz_localize('UTC') if obj.tzinfo is None else obj).isoformat()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def _records(df: pd.DataFrame) -> list:
+    """Convert a DataFrame to a list of row dicts via Arrow buffers"""
+    return pa.Table.from_pandas(df, preserve_index=False).to_pylist()
+
+
+def _json(payload, status: int = 200) -> Response:
+    """Serialize a payload with orjson into a JSON response"""
+    body = orjson.dumps(
+        payload,
+        default=_json_default,
+        option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS
+    )
+    return Response(body, status=status, mimetype='application/json')
+
+
+# Default and maximum analytics date range
+DEFAULT_START_DATE = '2024-01-01'
+DEFAULT_END_DATE = '2024-12-31'
+MAX_RANGE_DAYS = 366
+
+
+def _parse_range(req) -> tuple:
+    """
+    Read and validate the start_date/end_date query params
+    
+    Args:
+        req: Incoming request
+    
+    Returns:
+        Canonical (start_date, end_date) as YYYY-MM-DD strings
+    
+    Raises:
+        BadRequest: If a date is malformed, or the range is inverted or too wide
+    """
+    try:
+        start = datetime.strptime(req.args.get('start_date', DEFAULT_START_DATE), '%Y-%m-%d').date()
+        end = datetime.strptime(req.args.get('end_date', DEFAULT_END_DATE), '%Y-%m-%d').date()
+    except ValueError:
+        raise BadRequest('start_date and end_date must be dates in YYYY-MM-DD format')
+    
+    if end < start:
+        raise BadRequest('end_date must not be before start_date')
+    if (end - start).days > MAX_RANGE_DAYS:
+        raise BadRequest(f'Date range must not exceed {MAX_RANGE_DAYS} days')
+    
+    return start.isoformat(), end.isoformat()
+
+
+# Worker pool for fanning out independent extracts and transforms
+_executor = ThreadPoolExecutor(max_workers=4)
+
+
+def _extract_events_and_orders(start_date: str, end_date: str) -> tuple:
+    """Run the independent web event and order extracts concurrently"""
+    f_events = _executor.submit(_cached_extract_events, start_date, end_date)
+    f_orders = _executor.submit(_cached_extract_orders, start_date, end_date)
+    return f_events.result(), f_orders.result()
+
+
+def _cache_key(endpoint: str, req) -> str:
+    """Build the response cache key for an endpoint and its query params"""
+    # Dates are canonicalized so equivalent ranges share one entry
+    start_date, end_date = _parse_range(req)
+    params = [(k, v) for k, v in req.args.items(multi=True) if k not in ('start_date', 'end_date')]
+    params += [('end_date', end_date), ('start_date', start_date)]
+    return f"view/{endpoint}?{urlencode(sorted(params))}"
+
+
+def _cache_get(key: str):
+    """Read from the response cache, treating backend errors as a miss"""
+    try:
+        return cache.get(key)
+    except Exception as e:
+        logger.warning("Response cache read failed for %s: %s", key, e)
+        return None
+
+
+def _cache_set(key: str, body: bytes, timeout: int):
+    """Write to the response cache, ignoring backend errors"""
+    try:
+        cache.set(key, body, timeout=timeout)
+    except Exception as e:
+        logger.warning("Response cache write failed for %s: %s", key, e)
+
+
+def _etag(body: bytes) -> str:
+    """Entity tag for a cached response, derived from its stored body"""
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+def _cached_response(body: bytes) -> Response:
+    """Rebuild a JSON response from a cached gzip-compressed body"""
+    return Response(gzip.decompress(body), mimetype='application/json')
+
+
+def cached_endpoint(timeout: int):
+    """
+    Cache successful JSON responses of a GET endpoint
+    
+    Bodies are stored gzip-compressed, keyed by endpoint and query string.
+    A long-lived stale copy is kept alongside, and served when the handler
+    fails so clients still get the last good analytics (except during a
+    warm-up run, where the failure is raised for the warmer to report).
+    
+    Responses carry an ETag derived from the body and a Cache-Control header;
+    a request whose If-None-Match matches the current body gets a 304.
+    
+    Args:
+        timeout: Freshness lifetime of a cached response in seconds
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            key = _cache_key(request.endpoint, request)
+            refresh = g.get('cache_refresh', False)
+            body = None if refresh else _cache_get(key)
+            response = None
+            if body is None:
+                try:
+                    response = app.make_response(func(*args, **kwargs))
+                except Exception as e:
+                    # Warm-up runs re-raise so the warmer sees and logs the failure
+                    stale = None if refresh else _cache_get(f"stale/{key}")
+                    if stale is None:
+                        raise
+                    logger.warning("Serving stale response for %s: %s", key, e)
+                    response = _cached_response(stale)
+                    response.set_etag(_etag(stale))
+                    return response
+                
+                body = gzip.compress(response.get_data())
+                _cache_set(key, body, CACHE_TTL_WARM if refresh else timeout)
+                _cache_set(f"stale/{key}", body, CACHE_TTL_STALE)
+            
+            etag = _etag(body)
+            if request.if_none_match.contains_weak(etag):
+                response = Response(status=304)
+            elif response is None:
+                response = _cached_response(body)
+            
+            response.set_etag(etag)
+            response.cache_control.public = True
+            response.cache_control.max_age = timeout
+            return response
+        
+        CACHED_ENDPOINTS.append(func.__name__)
+        return wrapper
+    return decorator
+
+
+def safe_endpoint(func):
+    """
+    Time an endpoint and turn unhandled errors into a JSON 500 response
+    
+    HTTP errors such as BadRequest pass through to their error handlers.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except HTTPException:
+            raise
+        except Exception as e:
+            REQUEST_ERRORS.labels(func.__name__).inc()
+            logger.exception("Error in %s: %s", func.__name__, e)
+            return _json({'success': False, 'error': str(e)}, status=500)
+        finally:
+            REQUEST_LATENCY.labels(func.__name__).observe(time.perf_counter() - start)
+    return wrapper
+
+
+def _canonical_date_ranges(today: date) -> list:
+    """Query params for the date ranges precomputed by the cache warmer"""
+    end = today.isoformat()
+    return [
+        {},  # Default range served when no dates are given
+        {'start_date': today.replace(month=1, day=1).isoformat(), 'end_date': end},  # YTD
+        {'start_date': today.replace(day=1).isoformat(), 'end_date': end},  # MTD
+        {'start_date': (today - timedelta(days=30)).isoformat(), 'end_date': end}  # Last 30 days
+    ]
+
+
+def _acquire_warm_lock() -> bool:
+    """Claim this warm-up run so only one worker does it per interval.
+
+    With Redis the lock is shared by all workers (SET NX); SimpleCache is
+    per process, so every worker still warms its own cache.
+    """
+    try:
+        return cache.add(WARM_LOCK_KEY, os.getpid(), timeout=CACHE_WARM_INTERVAL_MINUTES * 30)
+    except Exception as e:
+        logger.warning("Cache warm-up lock unavailable, warming anyway: %s", e)
+        return True
+
+
+def warm_response_cache():
+    """Recompute every cached endpoint for the canonical date ranges"""
+    if not _acquire_warm_lock():
+        logger.info("Response cache warm-up for this interval already claimed by another worker")
+        return
+    
+    paths = {rule.endpoint: rule.rule for rule in app.url_map.iter_rules()}
+    
+    for endpoint in CACHED_ENDPOINTS:
+        for params in _canonical_date_ranges(date.today()):
+            with app.test_request_context(paths[endpoint], query_string=params):
+                g.cache_refresh = True
+                response = app.full_dispatch_request()
+                if response.status_code != 200:
+                    logger.warning("Cache warm-up failed for %s %s", endpoint, params)
+    
+    logger.info("Response cache warmed for %d endpoints", len(CACHED_ENDPOINTS))
+
+
+def start_cache_warmer() -> BackgroundScheduler:
+    """Start the background job that keeps the response cache warm"""
+    scheduler = BackgroundScheduler(daemon=True)
+    scheduler.add_job(
+        warm_response_cache,
+        'interval',
+        minutes=CACHE_WARM_INTERVAL_MINUTES,
+        next_run_time=datetime.now()
+    )
+    scheduler.start()
+    return scheduler
+
+
+@app.errorhandler(BadRequest)
+def _bad_request(e):
+    """Reject invalid query params before any ETL work"""
+    return _json({'success': False, 'error': e.description}, status=400)
+
+
+@app.before_request
+def _request_timestamp():
+    """Stamp the request once so every field in the response agrees"""
+    if request.endpoint != 'health_check':
+        g.ts = datetime.now().isoformat()
+
 
 @app.route('/health', methods=['GET'])
+@safe_endpoint
 def health_check():
     """Health check endpoint"""
-    return jsonify({
+    return _json({
         'status': 'healthy',
         'service': 'E-commerce Analytics API',
         'timestamp': datetime.now().isoformat()
     })
 
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Prometheus metrics endpoint
+    
+    Under gunicorn every worker writes its samples to PROMETHEUS_MULTIPROC_DIR,
+    and the scrape aggregates all of them; otherwise this process is reported.
+    """
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+
 @app.route('/api/v1/analytics/summary', methods=['GET'])
+@safe_endpoint
+@cached_endpoint(timeout=CACHE_TTL_NORMAL)
 def get_analytics_summary():
     """
     Get overall analytics summary
@@ -50,25 +390,20 @@ def get_analytics_summary():
         start_date: Start date (YYYY-MM-DD)
         end_date: End date (YYYY-MM-DD)
     """
-    try:
-        start_date = request.args.get('start_date', '2024-01-01')
-        end_date = request.args.get('end_date', '2024-12-31')
-        
-        # Run ETL pipeline
-        results = etl.run_full_pipeline(start_date, end_date)
-        
-        return jsonify({
-            'success': True,
-            'summary': results['summary'],
-            'timestamp': datetime.now().isoformat()
-        })
+    start_date, end_date = _parse_range(request)
     
-    except Exception as e:
-        logger.error(f"Error getting analytics summary: {e}")
-        return jsonify({'success': False, 'error': str(e)}), 500
+    events, orders = _extract_events_and_orders(start_date, end_date)
+    
+    return _json({
+        'success': True,
+        'summary': etl.calculate_summary(events, orders),
+        'timestamp': g.ts
+    })
 
 
 @app.route('/api/v1/customers/rfm', methods=['GET'])
+@safe_endpoint
+@cached_endpoint(timeout=CACHE_TTL_NORMAL)
 def get_rfm_analysis():
     """
     Get RFM (Recency, Frequency, Monetary) analysis
@@ -78,86 +413,60 @@ def get_rfm_analysis():
         end_date: End date
         segment: Filter by segment (optional)
     """
-    try:
-        start_date = request.args.get('start_date', '2024-01-01')
-        end_date = request.args.get('end_date', '2024-12-31')
-        segment_filter = request.args.get('segment')
-        
-        # Extract orders and calculate RFM
-        orders = etl.extract_orders(start_date, end_date)
-        rfm_scores = etl.calculate_rfm_scores(orders)
-        
-        # Filter by segment if provided
-        if segment_filter:
-            rfm_scores = rfm_scores[rfm_scores['segment'] == segment_filter]
-        
-        # Calculate segment distribution
-        segment_dist = rfm_scores['segment'].value_counts().to_dict()
-        
-        # Get top customers by monetary value
-        top_customers = rfm_scores.nlargest(10, 'monetary')[
-            ['customer_id', 'recency', 'frequency', 'monetary', 'segment']
-        ].to_dict(orient='records')
-        
-        return jsonify({
-            'success': True,
-            'segment_distribution': segment_dist,
-            'top_customers': top_customers,
-            'total_customers': len(rfm_scores),
-            'timestamp': datetime.now().isoformat()
-        })
+    start_date, end_date = _parse_range(request)
+    segment_filter = request.args.get('segment')
     
-    except Exception as e:
-        logger.error(f"Error in RFM analysis: {e}")
-        return jsonify({'success': False, 'error': str(e)}), 500
+    # Top customers by monetary value and segment distribution
+    top_customers, segment_dist, total_customers = _cached_rfm(
+        start_date, end_date, segment_filter
+    )
+    
+    return _json({
+        'success': True,
+        'segment_distribution': segment_dist,
+        'top_customers': _records(top_customers),
+        'total_customers': total_customers,
+        'timestamp': g.ts
+    })
 
 
 @app.route('/api/v1/customers/segments', methods=['GET'])
+@safe_endpoint
+@cached_endpoint(timeout=CACHE_TTL_LONG)
 def get_customer_segments():
     """Get customer segment definitions and counts"""
-    try:
-        start_date = request.args.get('start_date', '2024-01-01')
-        end_date = request.args.get('end_date', '2024-12-31')
-        
-        orders = etl.extract_orders(start_date, end_date)
-        rfm_scores = etl.calculate_rfm_scores(orders)
-        
-        # Segment definitions
-        segments = {
-            'Champions': {
-                'description': 'Best customers with high RFM scores',
-                'count': len(rfm_scores[rfm_scores['segment'] == 'Champions']),
-                'avg_monetary': float(rfm_scores[rfm_scores['segment'] == 'Champions']['monetary'].mean())
-            },
-            'Loyal Customers': {
-                'description': 'Regular buyers with good engagement',
-                'count': len(rfm_scores[rfm_scores['segment'] == 'Loyal Customers']),
-                'avg_monetary': float(rfm_scores[rfm_scores['segment'] == 'Loyal Customers']['monetary'].mean())
-            },
-            'At Risk': {
-                'description': 'Previously good customers who haven\'t purchased recently',
-                'count': len(rfm_scores[rfm_scores['segment'] == 'At Risk']),
-                'avg_monetary': float(rfm_scores[rfm_scores['segment'] == 'At Risk']['monetary'].mean())
-            },
-            'Lost Customers': {
-                'description': 'Haven\'t purchased in a long time',
-                'count': len(rfm_scores[rfm_scores['segment'] == 'Lost Customers']),
-                'avg_monetary': float(rfm_scores[rfm_scores['segment'] == 'Lost Customers']['monetary'].mean())
-            }
+    start_date, end_date = _parse_range(request)
+    
+    # Segment counts are aggregated at the source
+    stats = etl.extract_customer_segment_counts(start_date, end_date).set_index('segment')
+    
+    # Segment definitions
+    descriptions = {
+        'Champions': 'Best customers with high RFM scores',
+        'Loyal Customers': 'Regular buyers with good engagement',
+        'At Risk': 'Previously good customers who haven\'t purchased recently',
+        'Lost Customers': 'Haven\'t purchased in a long time'
+    }
+    
+    segments = {
+        name: {
+            'description': description,
+            'count': stats.loc[name, 'customer_count'] if name in stats.index else 0,
+            'avg_monetary': stats.loc[name, 'avg_monetary'] if name in stats.index else 0.0
         }
-        
-        return jsonify({
-            'success': True,
-            'segments': segments,
-            'timestamp': datetime.now().isoformat()
-        })
+        for name, description in descriptions.items()
+    }
     
-    except Exception as e:
-        logger.error(f"Error getting customer segments: {e}")
-        return jsonify({'success': False, 'error': str(e)}), 500
+    return _json({
+        'success': True,
+        'segments': segments,
+        'timestamp': g.ts
+    })
 
 
 @app.route('/api/v1/conversion/funnel', methods=['GET'])
+@safe_endpoint
+@cached_endpoint(timeout=CACHE_TTL_SHORT)
 def get_conversion_funnel():
     """
     Get conversion funnel analysis
@@ -166,36 +475,32 @@ def get_conversion_funnel():
         start_date: Start date
         end_date: End date
     """
-    try:
-        start_date = request.args.get('start_date', '2024-01-01')
-        end_date = request.args.get('end_date', '2024-12-31')
-        
-        # Extract events and calculate funnel
-        events = etl.extract_web_events(start_date, end_date)
-        funnel = etl.calculate_conversion_funnel(events)
-        
-        # Convert to dict for JSON response
-        funnel_data = funnel.to_dict(orient='records')
-        
-        # Calculate overall conversion rate
-        overall_conversion = (
-            funnel[funnel['stage'] == 'purchase']['sessions'].iloc[0] /
-            funnel[funnel['stage'] == 'visit']['sessions'].iloc[0] * 100
-        )
-        
-        return jsonify({
-            'success': True,
-            'funnel': funnel_data,
-            'overall_conversion_rate': round(float(overall_conversion), 2),
-            'timestamp': datetime.now().isoformat()
-        })
+    start_date, end_date = _parse_range(request)
     
-    except Exception as e:
-        logger.error(f"Error calculating conversion funnel: {e}")
-        return jsonify({'success': False, 'error': str(e)}), 500
+    # Extract events and calculate funnel
+    events = _cached_extract_events(start_date, end_date)
+    funnel = etl.calculate_conversion_funnel(events)
+    
+    # Convert to dict for JSON response
+    funnel_data = _records(funnel)
+    
+    # Calculate overall conversion rate
+    overall_conversion = (
+        funnel[funnel['stage'] == 'purchase']['sessions'].iloc[0] /
+        funnel[funnel['stage'] == 'visit']['sessions'].iloc[0] * 100
+    )
+    
+    return _json({
+        'success': True,
+        'funnel': funnel_data,
+        'overall_conversion_rate': round(overall_conversion, 2),
+        'timestamp': g.ts
+    })
 
 
 @app.route('/api/v1/products/affinity', methods=['GET'])
+@safe_endpoint
+@cached_endpoint(timeout=CACHE_TTL_NORMAL)
 def get_product_affinity():
     """
     Get product affinity analysis (products bought together)
@@ -206,38 +511,30 @@ def get_product_affinity():
         min_support: Minimum support threshold (default: 0.01)
         limit: Number of results to return (default: 20)
     """
-    try:
-        start_date = request.args.get('start_date', '2024-01-01')
-        end_date = request.args.get('end_date', '2024-12-31')
-        min_support = float(request.args.get('min_support', 0.01))
-        limit = int(request.args.get('limit', 20))
-        
-        # Extract data
-        orders = etl.extract_orders(start_date, end_date)
-        order_items = etl._generate_sample_order_items(orders)
-        
-        # Calculate affinity
-        affinity = etl.analyze_product_affinity(orders, order_items)
-        
-        # Filter by minimum support
-        affinity = affinity[affinity['support'] >= min_support]
-        
-        # Get top pairs
-        top_pairs = affinity.head(limit).to_dict(orient='records')
-        
-        return jsonify({
-            'success': True,
-            'product_pairs': top_pairs,
-            'total_pairs': len(affinity),
-            'timestamp': datetime.now().isoformat()
-        })
+    start_date, end_date = _parse_range(request)
+    min_support = float(request.args.get('min_support', 0.01))
+    limit = int(request.args.get('limit', 20))
     
-    except Exception as e:
-        logger.error(f"Error calculating product affinity: {e}")
-        return jsonify({'success': False, 'error': str(e)}), 500
+    # Extract data
+    orders = _cached_extract_orders(start_date, end_date)
+    order_items = etl._generate_sample_order_items(orders)
+    
+    # Calculate affinity, pruned to the support threshold and top pairs
+    affinity = etl.analyze_product_affinity(
+        orders, order_items, min_support=min_support, top_k=limit
+    )
+    
+    return _json({
+        'success': True,
+        'product_pairs': _records(affinity),
+        'total_pairs': affinity.attrs.get('total_pairs', len(affinity)),
+        'timestamp': g.ts
+    })
 
 
 @app.route('/api/v1/cohorts/retention', methods=['GET'])
+@safe_endpoint
+@cached_endpoint(timeout=CACHE_TTL_LONG)
 def get_cohort_retention():
     """
     Get cohort retention analysis
@@ -246,32 +543,30 @@ def get_cohort_retention():
         start_date: Start date
         end_date: End date
     """
-    try:
-        start_date = request.args.get('start_date', '2024-01-01')
-        end_date = request.args.get('end_date', '2024-12-31')
-        
-        # Extract orders and calculate cohorts
-        orders = etl.extract_orders(start_date, end_date)
-        cohorts = etl.analyze_cohorts(orders)
-        
-        # Convert to dict (handle Period index)
-        cohorts_dict = {}
-        for idx in cohorts.index:
-            cohorts_dict[str(idx)] = cohorts.loc[idx].to_dict()
-        
-        return jsonify({
-            'success': True,
-            'cohort_retention': cohorts_dict,
-            'num_cohorts': len(cohorts),
-            'timestamp': datetime.now().isoformat()
-        })
+    start_date, end_date = _parse_range(request)
     
-    except Exception as e:
-        logger.error(f"Error calculating cohort retention: {e}")
-        return jsonify({'success': False, 'error': str(e)}), 500
+    # Extract orders and calculate cohorts
+    orders = _cached_extract_orders(start_date, end_date)
+    cohorts = etl.analyze_cohorts(orders).sort_index()
+    
+    # Walk the matrix as plain lists instead of a per-row index lookup
+    columns = cohorts.columns.tolist()
+    cohorts_dict = {
+        str(label): dict(zip(columns, row))
+        for label, row in zip(cohorts.index, cohorts.to_numpy().tolist())
+    }
+    
+    return _json({
+        'success': True,
+        'cohort_retention': cohorts_dict,
+        'num_cohorts': len(cohorts),
+        'timestamp': g.ts
+    })
 
 
 @app.route('/api/v1/customers/behavior', methods=['GET'])
+@safe_endpoint
+@cached_endpoint(timeout=CACHE_TTL_SHORT)
 def get_customer_behavior():
     """
     Get customer behavior metrics
@@ -281,101 +576,96 @@ def get_customer_behavior():
         end_date: End date
         customer_id: Specific customer ID (optional)
     """
-    try:
-        start_date = request.args.get('start_date', '2024-01-01')
-        end_date = request.args.get('end_date', '2024-12-31')
-        customer_id = request.args.get('customer_id')
-        
-        # Extract and transform
-        events = etl.extract_web_events(start_date, end_date)
-        behavior = etl.transform_customer_behavior(events)
-        
-        # Filter by customer if provided
-        if customer_id:
-            behavior = behavior[behavior['customer_id'] == customer_id]
-        
-        # Calculate summary metrics
-        summary = {
-            'total_sessions': len(behavior),
-            'avg_session_duration': float(behavior['session_duration_seconds'].mean()),
-            'conversion_rate': float(behavior['converted'].mean() * 100),
-            'cart_abandonment_rate': float(behavior['abandoned_cart'].mean() * 100),
-            'avg_page_views': float(behavior['page_views_sum'].mean())
-        }
-        
-        # Get sample sessions
-        sample_sessions = behavior.head(10).to_dict(orient='records')
-        
-        return jsonify({
-            'success': True,
-            'summary': summary,
-            'sample_sessions': sample_sessions,
-            'timestamp': datetime.now().isoformat()
-        })
+    start_date, end_date = _parse_range(request)
+    customer_id = request.args.get('customer_id')
     
-    except Exception as e:
-        logger.error(f"Error getting customer behavior: {e}")
-        return jsonify({'success': False, 'error': str(e)}), 500
+    # Extract and transform
+    events = _cached_extract_events(start_date, end_date)
+    behavior = etl.transform_customer_behavior(events)
+    
+    # Filter by customer if provided
+    if customer_id:
+        behavior = behavior[behavior['customer_id'] == customer_id]
+    
+    # Calculate summary metrics in a single reduction over the frame
+    means = behavior[[
+        'session_duration_seconds', 'converted', 'abandoned_cart', 'page_views_sum'
+    ]].mean()
+    summary = {
+        'total_sessions': len(behavior),
+        'avg_session_duration': means['session_duration_seconds'],
+        'conversion_rate': means['converted'] * 100,
+        'cart_abandonment_rate': means['abandoned_cart'] * 100,
+        'avg_page_views': means['page_views_sum']
+    }
+    
+    # Get sample sessions
+    sample_sessions = _records(behavior.head(10))
+    
+    return _json({
+        'success': True,
+        'summary': summary,
+        'sample_sessions': sample_sessions,
+        'timestamp': g.ts
+    })
 
 
 @app.route('/api/v1/metrics/kpis', methods=['GET'])
+@safe_endpoint
+@cached_endpoint(timeout=CACHE_TTL_NORMAL)
 def get_kpis():
     """Get key performance indicators"""
-    try:
-        start_date = request.args.get('start_date', '2024-01-01')
-        end_date = request.args.get('end_date', '2024-12-31')
-        
-        # Run full pipeline
-        results = etl.run_full_pipeline(start_date, end_date)
-        
-        # Calculate KPIs
-        summary = results['summary']
-        funnel = results['conversion_funnel']
-        behavior = results['customer_behavior']
-        
-        kpis = {
-            'revenue': {
-                'total_revenue': round(summary['total_revenue'], 2),
-                'avg_order_value': round(summary['avg_order_value'], 2),
-                'revenue_per_customer': round(
-                    summary['total_revenue'] / summary['unique_customers'], 2
-                )
-            },
-            'conversion': {
-                'overall_rate': round(float(
-                    funnel[funnel['stage'] == 'purchase']['conversion_rate'].iloc[0]
-                ), 2),
-                'cart_abandonment_rate': round(float(
-                    behavior['abandoned_cart'].mean() * 100
-                ), 2)
-            },
-            'engagement': {
-                'avg_session_duration': round(float(
-                    behavior['session_duration_seconds'].mean()
-                ), 2),
-                'avg_page_views': round(float(
-                    behavior['page_views_sum'].mean()
-                ), 2)
-            },
-            'customers': {
-                'total_customers': summary['unique_customers'],
-                'total_orders': summary['total_orders'],
-                'orders_per_customer': round(
-                    summary['total_orders'] / summary['unique_customers'], 2
-                )
-            }
+    start_date, end_date = _parse_range(request)
+    
+    # Only compute the analyses the KPIs are built from
+    events, orders = _extract_events_and_orders(start_date, end_date)
+    
+    # Both transforms only read the events frame
+    f_funnel = _executor.submit(etl.calculate_conversion_funnel, events)
+    f_behavior = _executor.submit(etl.transform_customer_behavior, events)
+    summary = etl.calculate_summary(events, orders)
+    funnel, behavior = f_funnel.result(), f_behavior.result()
+    
+    # Calculate KPIs
+    behavior_means = behavior[[
+        'abandoned_cart', 'session_duration_seconds', 'page_views_sum'
+    ]].mean()
+    
+    kpis = {
+        'revenue': {
+            'total_revenue': round(summary['total_revenue'], 2),
+            'avg_order_value': round(summary['avg_order_value'], 2),
+            'revenue_per_customer': round(
+                summary['total_revenue'] / summary['unique_customers'], 2
+            )
+        },
+        'conversion': {
+            'overall_rate': round(
+                funnel[funnel['stage'] == 'purchase']['conversion_rate'].iloc[0], 2
+            ),
+            'cart_abandonment_rate': round(behavior_means['abandoned_cart'] * 100, 2)
+        },
+        'engagement': {
+            'avg_session_duration': round(behavior_means['session_duration_seconds'], 2),
+            'avg_page_views': round(behavior_means['page_views_sum'], 2)
+        },
+        'customers': {
+            'total_customers': summary['unique_customers'],
+            'total_orders': summary['total_orders'],
+            'orders_per_customer': round(
+                summary['total_orders'] / summary['unique_customers'], 2
+            )
         }
-        
-        return jsonify({
-            'success': True,
-            'kpis': kpis,
-            'timestamp': datetime.now().isoformat()
-        })
+    }
     
-    except Exception as e:
-        logger.error(f"Error calculating KPIs: {e}")
-        return jsonify({'success': False, 'error': str(e)}), 500
+    return _json({
+        'success': True,
+        'kpis': kpis,
+        'timestamp': g.ts
+    })
 
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    start_cache_warmer()
+    # Development server only; production runs under gunicorn (see api/wsgi.py)
+    app.run(host='0.0.0.0', port=5000)
@@ -0,0 +1,8 @@
+"""
+WSGI entrypoint for the E-commerce Analytics API
+
+Run with:
+    gunicorn -c config/gunicorn.conf.py api.wsgi:app
+"""
+
+from api.analytics_api import app
@@ -0,0 +1,44 @@
+"""
+Gunicorn configuration for the E-commerce Analytics API
+"""
+
+import glob
+import os
+import tempfile
+
+bind = f"0.0.0.0:{os.getenv('PORT', 5000)}"
+
+# Threaded workers: requests are dominated by warehouse I/O, not CPU
+workers = int(os.getenv('GUNICORN_WORKERS', 4))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+timeout = 120
+
+# Load the app (and the EcommerceETL instance) once in the master so
+# workers share it copy-on-write
+preload_app = True
+
+# Prometheus multiprocess mode: each worker writes its metrics to files in
+# this directory and /metrics aggregates them. It has to be set before the
+# app imports prometheus_client, and is emptied of a previous run's files.
+PROMETHEUS_MULTIPROC_DIR = os.environ.setdefault(
+    'PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'ecom_api_prometheus')
+)
+os.makedirs(PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+for path in glob.glob(os.path.join(PROMETHEUS_MULTIPROC_DIR, '*.db')):
+    os.remove(path)
+
+
+def post_worker_init(worker):
+    """Start the response cache warmer in each worker"""
+    # Started after fork: background threads do not survive into forked workers.
+    # With Redis a shared lock lets one worker warm per interval; with
+    # SimpleCache each worker warms its own in-process cache.
+    from api.analytics_api import start_cache_warmer
+    start_cache_warmer()
+
+
+def child_exit(server, worker):
+    """Drop an exited worker's live gauges from the aggregated metrics"""
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -5,15 +5,58 @@ Processes customer behavior, orders, and product data for analytics
 
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 from datetime import datetime, timedelta
-from typing import Dict, List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+import multiprocessing as mp
+from typing import Callable, Dict, List, Tuple
+from pathlib import Path
+import tempfile
 import logging
+import os
 from dataclasses import dataclass
 import json
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# RFM segment names, in the order their rules are evaluated
+RFM_SEGMENTS = [
+    'Champions',
+    'Loyal Customers',
+    'New Customers',
+    'At Risk',
+    'Lost Customers',
+    'Potential Loyalists',
+    'Regular Customers'
+]
+
+# Arrow-backed string dtype for id and label columns handed to the API
+ARROW_STRING = 'string[pyarrow]'
+
+# Bump when the sample generators change so stale Parquet caches are ignored
+SAMPLE_CACHE_VERSION = 2
+
+# Column dtypes applied at extraction. Grouping keys are categorical so
+# groupbys and merges hash small integer codes; event flags fit in int8.
+# In production the warehouse reads would use dtype_backend='pyarrow'.
+EVENT_DTYPES = {
+    'event_id': ARROW_STRING,
+    'customer_id': 'category',
+    'session_id': 'category',
+    'page_views': 'int8',
+    'product_views': 'int8',
+    'add_to_cart': 'int8',
+    'checkout_started': 'int8',
+    'purchase_completed': 'int8'
+}
+ORDER_DTYPES = {
+    'order_id': ARROW_STRING,
+    'customer_id': 'category',
+    'order_status': ARROW_STRING
+}
+
 
 @dataclass
 class CustomerSegment:
@@ -30,6 +73,8 @@ class EcommerceETL:
     def __init__(self, config: Dict):
         self.config = config
         self.batch_size = config.get('batch_size', 10000)
+        self.parallel_workers = config.get('parallel_workers', 1)
+        self.sample_cache_dir = config.get('sample_cache_dir')
     
     def extract_web_events(self, start_date: str, end_date: str) -> pd.DataFrame:
         """
@@ -43,32 +88,68 @@ class EcommerceETL:
             DataFrame with web events
         """
         try:
-            logger.info(f"Extracting web events from {start_date} to {end_date}")
+            logger.info("Extracting web events from %s to %s", start_date, end_date)
             
             # In production, this would connect to web analytics API
             # For demo, generate sample data
-            events = self._generate_sample_web_events(start_date, end_date)
+            events = self._load_sample('web_events', self._generate_sample_web_events, start_date, end_date)
+            events = events.astype(EVENT_DTYPES)
             
-            logger.info(f"Extracted {len(events)} web events")
+            logger.info("Extracted %d web events", len(events))
             return events
         
         except Exception as e:
-            logger.error(f"Error extracting web events: {e}")
+            logger.error("Error extracting web events: %s", e)
             raise
     
     def extract_orders(self, start_date: str, end_date: str) -> pd.DataFrame:
         """Extract order data from transactional database"""
         try:
-            logger.info(f"Extracting orders from {start_date} to {end_date}")
+            logger.info("Extracting orders from %s to %s", start_date, end_date)
             
             # In production, query from order database
-            orders = self._generate_sample_orders(start_date, end_date)
+            orders = self._load_sample('orders', self._generate_sample_orders, start_date, end_date)
+            orders = orders.astype(ORDER_DTYPES)
             
-            logger.info(f"Extracted {len(orders)} orders")
+            logger.info("Extracted %d orders", len(orders))
             return orders
         
         except Exception as e:
-            logger.error(f"Error extracting orders: {e}")
+            logger.error("Error extracting orders: %s", e)
+            raise
+    
+    def extract_customer_segment_counts(self, start_date: str, end_date: str) -> pd.DataFrame:
+        """
+        Extract customer counts and average monetary value per RFM segment
+        
+        Args:
+            start_date: Start date for extraction
+            end_date: End date for extraction
+        
+        Returns:
+            DataFrame with one row per segment
+        """
+        try:
+            logger.info("Extracting customer segment counts from %s to %s", start_date, end_date)
+            
+            # In production, aggregate in the warehouse and fetch only grouped rows:
+            #   SELECT customer_segment AS segment,
+            #          COUNT(*) AS customer_count,
+            #          AVG(monetary) AS avg_monetary
+            #   FROM agg.customer_rfm
+            #   WHERE last_order_date BETWEEN %(start_date)s AND %(end_date)s
+            #   GROUP BY customer_segment
+            # For demo, aggregate RFM scores over the sample orders
+            rfm = self.calculate_rfm_scores(self.extract_orders(start_date, end_date))
+            segment_counts = rfm.groupby('segment', observed=True)['monetary'].agg(
+                customer_count='size', avg_monetary='mean'
+            ).reset_index()
+            
+            logger.info("Extracted counts for %d segments", len(segment_counts))
+            return segment_counts
+        
+        except Exception as e:
+            logger.error("Error extracting customer segment counts: %s", e)
             raise
     
     def transform_customer_behavior(self, events: pd.DataFrame) -> pd.DataFrame:
@@ -84,38 +165,65 @@ class EcommerceETL:
         try:
             logger.info("Transforming customer behavior data")
             
-            # Aggregate by customer and session
-            behavior = events.groupby(['customer_id', 'session_id']).agg({
-                'event_timestamp': ['min', 'max', 'count'],
-                'page_views': 'sum',
-                'product_views': 'sum',
-                'add_to_cart': 'sum',
-                'checkout_started': 'sum',
-                'purchase_completed': 'sum'
-            }).reset_index()
-            
-            # Flatten column names
-            behavior.columns = ['_'.join(col).strip('_') for col in behavior.columns.values]
-            
-            # Calculate session duration
-            behavior['session_duration_seconds'] = (
-                behavior['event_timestamp_max'] - behavior['event_timestamp_min']
-            ).dt.total_seconds()
-            
-            # Calculate conversion flags
-            behavior['converted'] = (behavior['purchase_completed_sum'] > 0).astype(int)
-            behavior['abandoned_cart'] = (
-                (behavior['add_to_cart_sum'] > 0) & 
-                (behavior['purchase_completed_sum'] == 0)
-            ).astype(int)
-            
-            logger.info(f"Transformed {len(behavior)} customer sessions")
+            if self.parallel_workers > 1 and len(events) > self.batch_size:
+                behavior = self._aggregate_sessions_parallel(events)
+            else:
+                behavior = self._aggregate_sessions(events)
+            
+            logger.info("Transformed %d customer sessions", len(behavior))
             return behavior
         
         except Exception as e:
-            logger.error(f"Error transforming customer behavior: {e}")
+            logger.error("Error transforming customer behavior: %s", e)
             raise
     
+    def _aggregate_sessions(self, events: pd.DataFrame) -> pd.DataFrame:
+        """Aggregate web events into one behavior row per customer session"""
+        # Aggregate by customer and session (named aggregation gives flat columns)
+        behavior = events.groupby(['customer_id', 'session_id'], observed=True).agg(
+            event_timestamp_min=('event_timestamp', 'min'),
+            event_timestamp_max=('event_timestamp', 'max'),
+            event_timestamp_count=('event_timestamp', 'count'),
+            page_views_sum=('page_views', 'sum'),
+            product_views_sum=('product_views', 'sum'),
+            add_to_cart_sum=('add_to_cart', 'sum'),
+            checkout_started_sum=('checkout_started', 'sum'),
+            purchase_completed_sum=('purchase_completed', 'sum')
+        ).reset_index()
+        
+        # Calculate session duration and conversion flags on the underlying arrays
+        start = behavior['event_timestamp_min'].to_numpy()
+        end = behavior['event_timestamp_max'].to_numpy()
+        purchased = behavior['purchase_completed_sum'].to_numpy() > 0
+        carted = behavior['add_to_cart_sum'].to_numpy() > 0
+        
+        behavior['session_duration_seconds'] = (end - start) / np.timedelta64(1, 's')
+        behavior['converted'] = purchased.astype(np.int8)
+        behavior['abandoned_cart'] = (carted & ~purchased).astype(np.int8)
+        
+        return behavior
+    
+    def _aggregate_sessions_parallel(self, events: pd.DataFrame) -> pd.DataFrame:
+        """
+        Aggregate sessions across worker processes
+        
+        Events are partitioned by a hash of session_id, so every session lands
+        in exactly one partition and the partial results just concatenate.
+        """
+        n_parts = self.parallel_workers
+        part_ids = pd.util.hash_pandas_object(events['session_id'], index=False).to_numpy() % n_parts
+        parts = [events[part_ids == i] for i in range(n_parts)]
+        
+        # fork shares the parent's memory instead of re-importing in each worker
+        start_method = 'fork' if 'fork' in mp.get_all_start_methods() else None
+        with mp.get_context(start_method).Pool(n_parts) as pool:
+            partials = pool.map(self._aggregate_sessions, parts)
+        
+        # Restore the key order the single-process groupby returns
+        return pd.concat(partials).sort_values(
+            ['customer_id', 'session_id'], ignore_index=True
+        )
+    
     def calculate_rfm_scores(self, orders: pd.DataFrame) -> pd.DataFrame:
         """
         Calculate RFM (Recency, Frequency, Monetary) scores
@@ -131,110 +239,171 @@ class EcommerceETL:
             
             current_date = pd.Timestamp.now()
             
-            # Calculate RFM metrics
-            rfm = orders.groupby('customer_id').agg({
-                'order_date': lambda x: (current_date - x.max()).days,  # Recency
-                'order_id': 'count',  # Frequency
-                'order_total': 'sum'  # Monetary
-            }).reset_index()
+            # Calculate RFM metrics with built-in aggregations only
+            rfm = orders.groupby('customer_id', observed=True, sort=False).agg(
+                last_order_date=('order_date', 'max'),
+                frequency=('order_id', 'count'),
+                monetary=('order_total', 'sum')
+            ).reset_index()
             
-            rfm.columns = ['customer_id', 'recency', 'frequency', 'monetary']
+            # Recency in days, subtracted once over the whole column
+            recency = (current_date - rfm.pop('last_order_date')).dt.days
+            rfm.insert(1, 'recency', recency)
             
-            # Calculate RFM scores (1-5 scale)
-            rfm['r_score'] = pd.qcut(rfm['recency'], 5, labels=[5, 4, 3, 2, 1], duplicates='drop')
-            rfm['f_score'] = pd.qcut(rfm['frequency'], 5, labels=[1, 2, 3, 4, 5], duplicates='drop')
-            rfm['m_score'] = pd.qcut(rfm['monetary'], 5, labels=[1, 2, 3, 4, 5], duplicates='drop')
+            # Calculate RFM scores (1-5 scale, lower recency scores higher)
+            rfm['r_score'] = 6 - self._quantile_scores(rfm['recency'].to_numpy())
+            rfm['f_score'] = self._quantile_scores(rfm['frequency'].to_numpy())
+            rfm['m_score'] = self._quantile_scores(rfm['monetary'].to_numpy())
             
-            # Create RFM segment
+            # Create RFM segment, packed as an int (r=5, f=4, m=3 -> 543) whose
+            # digits read the same as the warehouse's CONCAT(r, f, m) string
             rfm['rfm_score'] = (
-                rfm['r_score'].astype(str) + 
-                rfm['f_score'].astype(str) + 
-                rfm['m_score'].astype(str)
+                rfm['r_score'].astype(np.int16) * 100 + 
+                rfm['f_score'].astype(np.int16) * 10 + 
+                rfm['m_score'].astype(np.int16)
             )
             
-            # Assign segment names
-            rfm['segment'] = rfm.apply(self._assign_rfm_segment, axis=1)
+            # Assign segments as a categorical built straight from the integer codes
+            segment_codes = self._assign_rfm_segments(
+                rfm['r_score'].to_numpy(), rfm['f_score'].to_numpy(), rfm['m_score'].to_numpy()
+            )
+            rfm['segment'] = pd.Categorical.from_codes(segment_codes, categories=RFM_SEGMENTS)
             
-            logger.info(f"Calculated RFM scores for {len(rfm)} customers")
+            logger.info("Calculated RFM scores for %d customers", len(rfm))
             return rfm
         
         except Exception as e:
-            logger.error(f"Error calculating RFM scores: {e}")
+            logger.error("Error calculating RFM scores: %s", e)
             raise
     
-    def _assign_rfm_segment(self, row) -> str:
-        """Assign customer segment based on RFM scores"""
-        r, f, m = int(row['r_score']), int(row['f_score']), int(row['m_score'])
-        
-        if r >= 4 and f >= 4 and m >= 4:
-            return 'Champions'
-        elif r >= 3 and f >= 3 and m >= 3:
-            return 'Loyal Customers'
-        elif r >= 4 and f <= 2:
-            return 'New Customers'
-        elif r <= 2 and f >= 3:
-            return 'At Risk'
-        elif r <= 2 and f <= 2:
-            return 'Lost Customers'
-        elif r >= 3 and f <= 2:
-            return 'Potential Loyalists'
-        else:
-            return 'Regular Customers'
+    @staticmethod
+    def _quantile_scores(values: np.ndarray, n: int = 5) -> np.ndarray:
+        """
+        Score values 1..n by quantile bucket
+        
+        Buckets are right-closed like pd.qcut, but repeated edges from tied
+        values just leave some scores unused instead of raising.
+        """
+        edges = np.quantile(values, np.linspace(0, 1, n + 1)[1:-1])
+        return (np.searchsorted(edges, values, side='left') + 1).astype(np.int8)
+    
+    @staticmethod
+    def _assign_rfm_segments(r: np.ndarray, f: np.ndarray, m: np.ndarray) -> np.ndarray:
+        """
+        Assign customer segments from RFM score arrays, first matching rule wins
+        
+        Returns int8 indexes into RFM_SEGMENTS rather than segment names.
+        """
+        conditions = [
+            (r >= 4) & (f >= 4) & (m >= 4),  # Champions
+            (r >= 3) & (f >= 3) & (m >= 3),  # Loyal Customers
+            (r >= 4) & (f <= 2),             # New Customers
+            (r <= 2) & (f >= 3),             # At Risk
+            (r <= 2) & (f <= 2),             # Lost Customers
+            (r >= 3) & (f <= 2)              # Potential Loyalists
+        ]
+        return np.select(
+            conditions, np.arange(len(conditions), dtype=np.int8), default=len(conditions)
+        ).astype(np.int8)
+    
+    def calculate_rfm_top_and_dist(self, orders: pd.DataFrame, limit: int = 10,
+                                   segment: str = None) -> Tuple[pd.DataFrame, Dict, int]:
+        """
+        Calculate the RFM views served to clients without keeping the full frame
+        
+        Args:
+            orders: Order data
+            limit: Number of top customers by monetary value to return
+            segment: Restrict the views to one segment (optional)
+        
+        Returns:
+            Tuple of (top customers, customer count per segment, total customers)
+        """
+        try:
+            rfm = self.calculate_rfm_scores(orders)
+            
+            # Segments are categorical: the filter and counts compare integer
+            # codes, and the distribution always lists every segment
+            segments = rfm['segment']
+            if segment:
+                mask = segments == segment
+                rfm, segments = rfm[mask], segments[mask]
+            
+            distribution = segments.value_counts().to_dict()
+            top_customers = rfm.nlargest(limit, 'monetary')[
+                ['customer_id', 'recency', 'frequency', 'monetary', 'segment']
+            ]
+            
+            return top_customers, distribution, len(rfm)
+        
+        except Exception as e:
+            logger.error("Error calculating RFM views: %s", e)
+            raise
     
     def analyze_product_affinity(self, orders: pd.DataFrame, 
-                                 order_items: pd.DataFrame) -> pd.DataFrame:
+                                 order_items: pd.DataFrame,
+                                 min_support: float = 0.0,
+                                 top_k: int = None) -> pd.DataFrame:
         """
         Analyze product affinity (products frequently bought together)
         
         Args:
             orders: Order data
             order_items: Order line items
+            min_support: Minimum support for a pair to be kept
+            top_k: Keep only the top_k pairs by co-occurrence (all if None)
         
         Returns:
-            Product affinity matrix
+            Product affinity matrix; attrs['total_pairs'] holds the number
+            of pairs meeting min_support before the top_k cut
         """
         try:
             logger.info("Analyzing product affinity")
             
-            # Create product pairs from same orders
-            pairs = []
+            total_orders = len(orders)
             
-            for order_id in order_items['order_id'].unique():
-                products = order_items[order_items['order_id'] == order_id]['product_id'].tolist()
-                
-                # Generate all pairs
-                for i in range(len(products)):
-                    for j in range(i + 1, len(products)):
-                        pairs.append({
-                            'product_a': products[i],
-                            'product_b': products[j],
-                            'order_id': order_id
-                        })
-            
-            if not pairs:
-                return pd.DataFrame()
+            # Support counts orders, so each product counts once per order
+            order_items = order_items[['order_id', 'product_id']].drop_duplicates()
             
-            affinity_df = pd.DataFrame(pairs)
+            # Apriori pruning: a pair is never more frequent than either of its
+            # products, so infrequent products cannot form a frequent pair
+            if min_support > 0:
+                product_orders = order_items['product_id'].value_counts()
+                frequent = product_orders.index[product_orders / total_orders >= min_support]
+                order_items = order_items[order_items['product_id'].isin(frequent)]
             
-            # Calculate affinity metrics
-            affinity = affinity_df.groupby(['product_a', 'product_b']).agg({
-                'order_id': 'count'
-            }).reset_index()
+            # Create product pairs from same orders with a self-join; ordering
+            # the pair keeps each unordered pair once per order
+            pairs = order_items.merge(order_items, on='order_id', suffixes=('_a', '_b'))
+            pairs = pairs[pairs['product_id_a'] < pairs['product_id_b']]
+            
+            if pairs.empty:
+                return pd.DataFrame()
+            
+            # Calculate affinity metrics (frequency table of observed pairs only)
+            affinity = pairs.value_counts(
+                ['product_id_a', 'product_id_b'], sort=False
+            ).reset_index(name='co_occurrence_count')
             
             affinity.columns = ['product_a', 'product_b', 'co_occurrence_count']
             
             # Calculate support (percentage of orders containing both products)
-            total_orders = len(orders)
             affinity['support'] = affinity['co_occurrence_count'] / total_orders
+            affinity = affinity[affinity['support'] >= min_support]
+            total_pairs = len(affinity)
             
-            # Sort by co-occurrence
-            affinity = affinity.sort_values('co_occurrence_count', ascending=False)
+            # Sort by co-occurrence, selecting only the top pairs when bounded
+            if top_k is None:
+                affinity = affinity.sort_values('co_occurrence_count', ascending=False)
+            else:
+                affinity = affinity.nlargest(top_k, 'co_occurrence_count')
+            affinity.attrs['total_pairs'] = total_pairs
             
-            logger.info(f"Found {len(affinity)} product affinity pairs")
+            logger.info("Found %s product affinity pairs", total_pairs)
             return affinity
         
         except Exception as e:
-            logger.error(f"Error analyzing product affinity: {e}")
+            logger.error("Error analyzing product affinity: %s", e)
             raise
     
     def calculate_conversion_funnel(self, events: pd.DataFrame) -> pd.DataFrame:
@@ -250,13 +419,19 @@ class EcommerceETL:
         try:
             logger.info("Calculating conversion funnel")
             
+            # Per-session max of each stage flag, in a single pass over the events
+            session_flags = events.groupby('session_id', observed=True, sort=False)[[
+                'product_views', 'add_to_cart', 'checkout_started', 'purchase_completed'
+            ]].max()
+            reached = (session_flags > 0).sum()
+            
             # Define funnel stages
             funnel_stages = {
-                'visit': events['session_id'].nunique(),
-                'product_view': events[events['product_views'] > 0]['session_id'].nunique(),
-                'add_to_cart': events[events['add_to_cart'] > 0]['session_id'].nunique(),
-                'checkout': events[events['checkout_started'] > 0]['session_id'].nunique(),
-                'purchase': events[events['purchase_completed'] > 0]['session_id'].nunique()
+                'visit': len(session_flags),
+                'product_view': int(reached['product_views']),
+                'add_to_cart': int(reached['add_to_cart']),
+                'checkout': int(reached['checkout_started']),
+                'purchase': int(reached['purchase_completed'])
             }
             
             # Create funnel DataFrame
@@ -278,7 +453,7 @@ class EcommerceETL:
             return funnel
         
         except Exception as e:
-            logger.error(f"Error calculating conversion funnel: {e}")
+            logger.error("Error calculating conversion funnel: %s", e)
             raise
     
     def analyze_cohorts(self, orders: pd.DataFrame) -> pd.DataFrame:
@@ -294,86 +469,158 @@ class EcommerceETL:
         try:
             logger.info("Performing cohort analysis")
             
-            # Get first purchase date for each customer
-            orders['order_month'] = orders['order_date'].dt.to_period('M')
-            
-            cohorts = orders.groupby('customer_id').agg({
-                'order_date': 'min',
-                'order_month': 'min'
-            }).reset_index()
-            
-            cohorts.columns = ['customer_id', 'first_purchase_date', 'cohort_month']
+            # Months as integer Period ordinals (months since 1970-01), so month
+            # arithmetic is plain int math (input frame is left untouched)
+            order_dates = orders['order_date'].dt
+            orders = orders.assign(
+                order_month=((order_dates.year - 1970) * 12 + order_dates.month - 1).astype(np.int32)
+            )
             
-            # Merge back to orders
-            orders_with_cohort = orders.merge(cohorts, on='customer_id')
+            # Broadcast each customer's first purchase month onto their orders
+            cohort_month = orders.groupby(
+                'customer_id', observed=True, sort=False
+            )['order_month'].transform('min')
             
             # Calculate months since first purchase
-            orders_with_cohort['months_since_first'] = (
-                orders_with_cohort['order_month'] - 
-                orders_with_cohort['cohort_month']
-            ).apply(lambda x: x.n)
+            orders_with_cohort = orders.assign(
+                cohort_month=cohort_month,
+                months_since_first=(orders['order_month'] - cohort_month).astype(np.int16)
+            )
             
-            # Create cohort matrix
-            cohort_data = orders_with_cohort.groupby([
+            # Create cohort matrix by unstacking the (already sorted) group
+            # counts, rather than resetting and re-sorting them in a pivot
+            cohort_matrix = orders_with_cohort.groupby([
                 'cohort_month', 'months_since_first'
-            ])['customer_id'].nunique().reset_index()
+            ])['customer_id'].nunique().unstack('months_since_first')
             
-            cohort_matrix = cohort_data.pivot(
-                index='cohort_month',
-                columns='months_since_first',
-                values='customer_id'
-            )
-            
-            # Calculate retention rates
-            cohort_sizes = cohort_matrix.iloc[:, 0]
+            # Calculate retention rates; every cohort has orders in month 0
+            cohort_sizes = cohort_matrix[0]
             retention = cohort_matrix.divide(cohort_sizes, axis=0) * 100
+            retention.index = pd.PeriodIndex(ordinal=retention.index, freq='M', name='cohort_month')
             
-            logger.info(f"Cohort analysis complete for {len(cohort_matrix)} cohorts")
+            logger.info("Cohort analysis complete for %d cohorts", len(cohort_matrix))
             return retention
         
         except Exception as e:
-            logger.error(f"Error in cohort analysis: {e}")
+            logger.error("Error in cohort analysis: %s", e)
             raise
     
+    @staticmethod
+    def _format_ids(prefix: str, numbers: np.ndarray, width: int) -> pd.api.extensions.ExtensionArray:
+        """Format integer ids as zero-padded Arrow-backed strings, e.g. CUST-0042"""
+        return pd.array(np.char.add(prefix, np.char.zfill(numbers.astype(str), width)), dtype=ARROW_STRING)
+    
+    def _load_sample(self, name: str, generate: Callable, start_date: str, end_date: str) -> pd.DataFrame:
+        """
+        Load generated sample data from a Parquet cache, generating it on a miss
+        
+        The cache is opt-in: without 'sample_cache_dir' in the config the
+        data is always regenerated. Files are never evicted, so only point
+        it at a directory for a bounded set of ranges, such as test runs.
+        """
+        if not self.sample_cache_dir:
+            return generate(start_date, end_date)
+        
+        path = Path(self.sample_cache_dir) / (
+            f"ecom_sample_v{SAMPLE_CACHE_VERSION}_{name}_{start_date}_{end_date}.parquet"
+        )
+        if path.exists():
+            try:
+                # Strings come back Arrow-backed, as the generators produce them.
+                # Mapped per read: pandas' global string_storage option is not thread-safe.
+                return pq.read_table(path).to_pandas(types_mapper={pa.string(): pd.StringDtype('pyarrow')}.get)
+            except Exception as e:
+                logger.warning("Ignoring unreadable sample cache %s: %s", path, e)
+        
+        df = generate(start_date, end_date)
+        
+        # Write to a uniquely named file and rename so concurrent writers and
+        # readers, across processes or threads, never see a partial file
+        tmp_path = None
+        try:
+            with tempfile.NamedTemporaryFile(
+                dir=path.parent, prefix=f"{path.name}.", suffix='.tmp', delete=False
+            ) as tmp:
+                tmp_path = Path(tmp.name)
+                df.to_parquet(tmp, compression='zstd', version='2.6')
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("Could not write sample cache %s: %s", path, e)
+            if tmp_path is not None:
+                tmp_path.unlink(missing_ok=True)
+        
+        return df
+    
+    @staticmethod
+    def _even_timestamps(start_date: str, end_date: str, n: int) -> np.ndarray:
+        """
+        Evenly spaced datetime64[ns] values from start_date to end_date inclusive
+        
+        Same values as pd.date_range(start, end, periods=n), computed on int64
+        nanoseconds without building a DatetimeIndex.
+        """
+        start_ns = pd.Timestamp(start_date).value
+        offsets = np.linspace(0, pd.Timestamp(end_date).value - start_ns, n).astype(np.int64)
+        return (offsets + start_ns).view('datetime64[ns]')
+    
     def _generate_sample_web_events(self, start_date: str, end_date: str) -> pd.DataFrame:
         """Generate sample web events for demo"""
-        np.random.seed(42)
+        rng = np.random.RandomState(42)
         
         n_events = 10000
         n_customers = 500
         n_sessions = 2000
         
         events = pd.DataFrame({
-            'event_id': [f'EVT-{i:06d}' for i in range(n_events)],
-            'customer_id': [f'CUST-{np.random.randint(1, n_customers):04d}' for _ in range(n_events)],
-            'session_id': [f'SESS-{np.random.randint(1, n_sessions):05d}' for _ in range(n_events)],
-            'event_timestamp': pd.date_range(start=start_date, end=end_date, periods=n_events),
-            'page_views': np.random.randint(0, 5, n_events),
-            'product_views': np.random.randint(0, 3, n_events),
-            'add_to_cart': np.random.randint(0, 2, n_events),
-            'checkout_started': np.random.randint(0, 2, n_events),
-            'purchase_completed': np.random.randint(0, 2, n_events)
+            'event_id': self._format_ids('EVT-', np.arange(n_events), 6),
+            'customer_id': self._format_ids('CUST-', rng.randint(1, n_customers, n_events), 4),
+            'session_id': self._format_ids('SESS-', rng.randint(1, n_sessions, n_events), 5),
+            'event_timestamp': self._even_timestamps(start_date, end_date, n_events),
+            'page_views': rng.randint(0, 5, n_events),
+            'product_views': rng.randint(0, 3, n_events),
+            'add_to_cart': rng.randint(0, 2, n_events),
+            'checkout_started': rng.randint(0, 2, n_events),
+            'purchase_completed': rng.randint(0, 2, n_events)
         })
         
         return events
     
     def _generate_sample_orders(self, start_date: str, end_date: str) -> pd.DataFrame:
         """Generate sample orders for demo"""
-        np.random.seed(42)
+        rng = np.random.RandomState(42)
         
         n_orders = 2000
         n_customers = 500
         
         orders = pd.DataFrame({
-            'order_id': [f'ORD-{i:06d}' for i in range(n_orders)],
-            'customer_id': [f'CUST-{np.random.randint(1, n_customers):04d}' for _ in range(n_orders)],
-            'order_date': pd.date_range(start=start_date, end=end_date, periods=n_orders),
-            'order_total': np.random.uniform(20, 500, n_orders).round(2),
-            'order_status': np.random.choice(['completed', 'pending', 'cancelled'], n_orders, p=[0.85, 0.10, 0.05])
+            'order_id': self._format_ids('ORD-', np.arange(n_orders), 6),
+            'customer_id': self._format_ids('CUST-', rng.randint(1, n_customers, n_orders), 4),
+            'order_date': self._even_timestamps(start_date, end_date, n_orders),
+            'order_total': rng.uniform(20, 500, n_orders).round(2),
+            'order_status': rng.choice(['completed', 'pending', 'cancelled'], n_orders, p=[0.85, 0.10, 0.05])
         })
         
         return orders
     
+    def calculate_summary(self, events: pd.DataFrame, orders: pd.DataFrame) -> Dict:
+        """
+        Calculate headline event and order metrics
+        
+        Args:
+            events: Web events data
+            orders: Order data
+        
+        Returns:
+            Dictionary with summary metrics
+        """
+        return {
+            'total_events': len(events),
+            'total_orders': len(orders),
+            'unique_customers': orders['customer_id'].nunique(),
+            'total_revenue': orders['order_total'].sum(),
+            'avg_order_value': orders['order_total'].mean()
+        }
+    
     def run_full_pipeline(self, start_date: str, end_date: str) -> Dict:
         """
         Run complete ETL pipeline
@@ -392,54 +639,53 @@ class EcommerceETL:
             events = self.extract_web_events(start_date, end_date)
             orders = self.extract_orders(start_date, end_date)
             
-            # Transform
-            customer_behavior = self.transform_customer_behavior(events)
-            rfm_scores = self.calculate_rfm_scores(orders)
-            funnel = self.calculate_conversion_funnel(events)
-            cohorts = self.analyze_cohorts(orders)
-            
-            # Generate sample order items for affinity analysis
-            order_items = self._generate_sample_order_items(orders)
-            affinity = self.analyze_product_affinity(orders, order_items)
-            
-            results = {
-                'customer_behavior': customer_behavior,
-                'rfm_scores': rfm_scores,
-                'conversion_funnel': funnel,
-                'cohort_retention': cohorts,
-                'product_affinity': affinity,
-                'summary': {
-                    'total_events': len(events),
-                    'total_orders': len(orders),
-                    'unique_customers': orders['customer_id'].nunique(),
-                    'total_revenue': orders['order_total'].sum(),
-                    'avg_order_value': orders['order_total'].mean()
+            # Transform; the stages only read their inputs, so they run
+            # concurrently while pandas/numpy release the GIL
+            with ThreadPoolExecutor(max_workers=5) as executor:
+                behavior_future = executor.submit(self.transform_customer_behavior, events)
+                rfm_future = executor.submit(self.calculate_rfm_scores, orders)
+                funnel_future = executor.submit(self.calculate_conversion_funnel, events)
+                cohorts_future = executor.submit(self.analyze_cohorts, orders)
+                
+                # Generate sample order items for affinity analysis
+                order_items = self._generate_sample_order_items(orders)
+                affinity_future = executor.submit(self.analyze_product_affinity, orders, order_items)
+                
+                results = {
+                    'customer_behavior': behavior_future.result(),
+                    'rfm_scores': rfm_future.result(),
+                    'conversion_funnel': funnel_future.result(),
+                    'cohort_retention': cohorts_future.result(),
+                    'product_affinity': affinity_future.result(),
+                    'summary': self.calculate_summary(events, orders)
                 }
-            }
             
             logger.info("ETL pipeline completed successfully")
             return results
         
         except Exception as e:
-            logger.error(f"Error in ETL pipeline: {e}")
+            logger.error("Error in ETL pipeline: %s", e)
             raise
     
     def _generate_sample_order_items(self, orders: pd.DataFrame) -> pd.DataFrame:
         """Generate sample order items"""
-        np.random.seed(42)
-        
-        items = []
-        for order_id in orders['order_id']:
-            n_items = np.random.randint(1, 5)
-            for _ in range(n_items):
-                items.append({
-                    'order_id': order_id,
-                    'product_id': f'PROD-{np.random.randint(1, 100):03d}',
-                    'quantity': np.random.randint(1, 4),
-                    'unit_price': np.random.uniform(10, 200)
-                })
-        
-        return pd.DataFrame(items)
+        rng = np.random.RandomState(42)
+        
+        # 1-4 items per order, drawn for all orders at once
+        n_items = rng.randint(1, 5, len(orders))
+        n_total = n_items.sum()
+        
+        # Ordered product categories keep the affinity pair comparison valid
+        items = pd.DataFrame({
+            'order_id': pd.Categorical(np.repeat(orders['order_id'].to_numpy(), n_items)),
+            'product_id': pd.Categorical(
+                self._format_ids('PROD-', rng.randint(1, 100, n_total), 3), ordered=True
+            ),
+            'quantity': rng.randint(1, 4, n_total).astype(np.int8),
+            'unit_price': rng.uniform(10, 200, n_total)
+        })
+        
+        return items
 
 
 if __name__ == "__main__":
@@ -0,0 +1,148 @@
+"""
+Unit tests for the E-commerce Analytics API
+"""
+
+import unittest
+from unittest import mock
+import warnings
+import pandas as pd
+import sys
+import os
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api import analytics_api
+from api.analytics_api import app, cache, etl
+
+
+class TestCachedEndpoints(unittest.TestCase):
+    """Test response caching and conditional requests"""
+    
+    RFM_PATH = '/api/v1/customers/rfm'
+    
+    def setUp(self):
+        self.client = app.test_client()
+        self._clear_caches()
+    
+    def _clear_caches(self):
+        """Drop cached responses and extracted frames"""
+        cache.clear()
+        analytics_api._frame_cache.clear()
+    
+    def test_matching_etag_returns_not_modified(self):
+        """Test If-None-Match with the current ETag gets a 304"""
+        first = self.client.get(self.RFM_PATH)
+        self.assertEqual(first.status_code, 200)
+        self.assertIsNotNone(first.headers.get('ETag'))
+        
+        second = self.client.get(self.RFM_PATH, headers={'If-None-Match': first.headers['ETag']})
+        self.assertEqual(second.status_code, 304)
+    
+    def test_changed_body_gets_new_etag(self):
+        """Test a recomputed response with different content gets a new ETag"""
+        first = self.client.get(self.RFM_PATH)
+        self._clear_caches()
+        
+        extract_orders = etl.extract_orders
+        
+        def doubled_orders(start_date, end_date):
+            orders = extract_orders(start_date, end_date)
+            return orders.assign(order_total=orders['order_total'] * 2)
+        
+        with mock.patch.object(etl, 'extract_orders', side_effect=doubled_orders):
+            second = self.client.get(
+                self.RFM_PATH, headers={'If-None-Match': first.headers['ETag']}
+            )
+        
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(second.get_data(), first.get_data())
+        self.assertNotEqual(second.headers['ETag'], first.headers['ETag'])
+    
+    def test_failure_serves_stale_copy(self):
+        """Test a failing handler falls back to the last good response"""
+        first = self.client.get(self.RFM_PATH)
+        with app.test_request_context(self.RFM_PATH):
+            cache.delete(analytics_api._cache_key('get_rfm_analysis', analytics_api.request))
+        analytics_api._frame_cache.clear()
+        
+        with mock.patch.object(etl, 'extract_orders', side_effect=RuntimeError('warehouse down')):
+            second = self.client.get(self.RFM_PATH)
+        
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.get_data(), first.get_data())
+    
+    def test_warm_up_failure_is_reported(self):
+        """Test a failing warm-up run is logged instead of served from the stale copy"""
+        self.client.get(self.RFM_PATH)
+        analytics_api._frame_cache.clear()
+        
+        with mock.patch.object(etl, 'extract_orders', side_effect=RuntimeError('warehouse down')), \
+                self.assertLogs(analytics_api.logger, level='WARNING') as logs:
+            analytics_api.warm_response_cache()
+        
+        self.assertTrue(any('Cache warm-up failed for get_rfm_analysis {}' in line for line in logs.output))
+    
+    def test_warm_up_skipped_while_locked(self):
+        """Test a warm-up run is skipped when another worker holds the lock"""
+        cache.add(analytics_api.WARM_LOCK_KEY, 0)
+        
+        with mock.patch.object(app, 'full_dispatch_request') as dispatch:
+            analytics_api.warm_response_cache()
+        
+        dispatch.assert_not_called()
+
+
+class TestDateRangeParams(unittest.TestCase):
+    """Test validation and canonicalization of start_date/end_date"""
+    
+    RFM_PATH = '/api/v1/customers/rfm'
+    
+    def setUp(self):
+        self.client = app.test_client()
+    
+    def _assert_bad_request(self, query_string):
+        """Assert a request is rejected with a JSON 400 before any ETL work"""
+        with mock.patch.object(etl, 'extract_orders') as extract_orders:
+            response = self.client.get(self.RFM_PATH, query_string=query_string)
+        
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.get_json()['success'])
+        extract_orders.assert_not_called()
+    
+    def test_malformed_date_rejected(self):
+        """Test an invalid date gets a 400"""
+        self._assert_bad_request({'start_date': '2024-13-01'})
+    
+    def test_inverted_range_rejected(self):
+        """Test end_date before start_date gets a 400"""
+        self._assert_bad_request({'start_date': '2024-06-01', 'end_date': '2024-05-31'})
+    
+    def test_too_wide_range_rejected(self):
+        """Test a range longer than MAX_RANGE_DAYS gets a 400"""
+        self._assert_bad_request({'start_date': '2023-01-01', 'end_date': '2024-12-31'})
+    
+    def test_equivalent_dates_share_cache_key(self):
+        """Test unpadded and padded dates map to the same cache key"""
+        keys = []
+        for start_date in ('2024-1-1', '2024-01-01'):
+            with app.test_request_context(self.RFM_PATH, query_string={'start_date': start_date}):
+                keys.append(analytics_api._cache_key('get_rfm_analysis', analytics_api.request))
+        
+        self.assertEqual(keys[0], keys[1])
+
+
+class TestJsonSerialization(unittest.TestCase):
+    """Test orjson serialization of pandas values"""
+    
+    def test_timestamp_keeps_nanoseconds(self):
+        """Test a nanosecond Timestamp serializes losslessly without warnings"""
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            body = analytics_api._json({'ts': pd.Timestamp('2024-01-01 10:00:00.123456789')}).get_data()
+        
+        self.assertEqual(body, b'{"ts":"2024-01-01T10:00:00.123456789+00:00"}')
+
+
+if __name__ == '__main__':
+    unittest.main()
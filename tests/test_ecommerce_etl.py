@@ -3,16 +3,21 @@ Unit tests for E-commerce ETL Pipeline
 """
 
 import unittest
+from unittest import mock
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 import sys
 import os
+import tempfile
 
 # Add parent directory to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from src.ecommerce_etl import EcommerceETL
+from src.ecommerce_etl import EcommerceETL, RFM_SEGMENTS
+
+# Generated sample data is memoized here across test runs
+SAMPLE_CACHE_DIR = tempfile.gettempdir()
 
 
 class TestEcommerceETL(unittest.TestCase):
@@ -23,7 +28,8 @@ class TestEcommerceETL(unittest.TestCase):
         self.config = {
             'batch_size': 1000,
             'snowflake_account': 'test_account',
-            'database': 'test_db'
+            'database': 'test_db',
+            'sample_cache_dir': SAMPLE_CACHE_DIR
         }
         self.etl = EcommerceETL(self.config)
         
@@ -75,6 +81,45 @@ class TestEcommerceETL(unittest.TestCase):
         self.assertIn('customer_id', orders.columns)
         self.assertIn('order_total', orders.columns)
     
+    def test_extract_sample_cache(self):
+        """Test sample data is written to and reloaded from the Parquet cache"""
+        with tempfile.TemporaryDirectory() as cache_dir:
+            etl = EcommerceETL({'batch_size': 1000, 'sample_cache_dir': cache_dir})
+            
+            first = etl.extract_orders('2024-01-01', '2024-12-31')
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+            
+            second = etl.extract_orders('2024-01-01', '2024-12-31')
+            pd.testing.assert_frame_equal(first, second)
+        
+        # Cached and freshly generated frames match, dtypes included
+        uncached = EcommerceETL({'batch_size': 1000, 'sample_cache_dir': None})
+        pd.testing.assert_frame_equal(second, uncached.extract_orders('2024-01-01', '2024-12-31'))
+    
+    def test_extract_sample_cache_failed_write(self):
+        """Test a failed cache write still returns data and leaves no temp file"""
+        with tempfile.TemporaryDirectory() as cache_dir:
+            etl = EcommerceETL({'batch_size': 1000, 'sample_cache_dir': cache_dir})
+            
+            with mock.patch('src.ecommerce_etl.os.replace', side_effect=OSError('disk full')):
+                orders = etl.extract_orders('2024-01-01', '2024-12-31')
+            
+            self.assertGreater(len(orders), 0)
+            self.assertEqual(os.listdir(cache_dir), [])
+    
+    def test_extract_customer_segment_counts(self):
+        """Test per-segment customer count extraction"""
+        segment_counts = self.etl.extract_customer_segment_counts('2024-01-01', '2024-12-31')
+        orders = self.etl.extract_orders('2024-01-01', '2024-12-31')
+        
+        self.assertIsInstance(segment_counts, pd.DataFrame)
+        self.assertIn('segment', segment_counts.columns)
+        self.assertIn('customer_count', segment_counts.columns)
+        self.assertIn('avg_monetary', segment_counts.columns)
+        
+        # Every customer falls into exactly one segment
+        self.assertEqual(segment_counts['customer_count'].sum(), orders['customer_id'].nunique())
+    
     def test_transform_customer_behavior(self):
         """Test customer behavior transformation"""
         behavior = self.etl.transform_customer_behavior(self.sample_events)
@@ -85,6 +130,15 @@ class TestEcommerceETL(unittest.TestCase):
         self.assertIn('converted', behavior.columns)
         self.assertIn('abandoned_cart', behavior.columns)
     
+    def test_transform_customer_behavior_parallel(self):
+        """Test partitioned multi-process aggregation matches the serial result"""
+        parallel_etl = EcommerceETL({'batch_size': 50, 'parallel_workers': 2})
+        
+        serial = self.etl.transform_customer_behavior(self.sample_events)
+        parallel = parallel_etl.transform_customer_behavior(self.sample_events)
+        
+        pd.testing.assert_frame_equal(parallel, serial)
+    
     def test_calculate_rfm_scores(self):
         """Test RFM score calculation"""
         rfm = self.etl.calculate_rfm_scores(self.sample_orders)
@@ -106,23 +160,58 @@ class TestEcommerceETL(unittest.TestCase):
         self.assertTrue((rfm['r_score'] <= 5).all())
         self.assertTrue((rfm['f_score'] >= 1).all())
         self.assertTrue((rfm['f_score'] <= 5).all())
+        
+        # Packed score keeps the r, f, m digits in order
+        first = rfm.iloc[0]
+        self.assertEqual(str(first['rfm_score']), f"{first['r_score']}{first['f_score']}{first['m_score']}")
+    
+    def test_calculate_rfm_scores_with_ties(self):
+        """Test RFM scoring when most customers share the same frequency"""
+        orders = pd.DataFrame({
+            'order_id': [f'ORD-{i:04d}' for i in range(24)],
+            'customer_id': [f'CUST-{i:03d}' for i in range(20)] + ['CUST-000'] * 4,
+            'order_date': pd.date_range('2024-01-01', periods=24, freq='D'),
+            'order_total': np.linspace(20, 500, 24).round(2),
+            'order_status': ['completed'] * 24
+        })
+        
+        rfm = self.etl.calculate_rfm_scores(orders)
+        
+        # Scores are plain int8 columns, usable without casting
+        for col in ['r_score', 'f_score', 'm_score']:
+            self.assertEqual(rfm[col].dtype, np.int8)
+        
+        # Tied single-order customers all share one frequency score
+        single = rfm[rfm['frequency'] == 1]
+        self.assertEqual(single['f_score'].nunique(), 1)
+        self.assertGreater(rfm.loc[rfm['customer_id'] == 'CUST-000', 'f_score'].iloc[0],
+                           single['f_score'].iloc[0])
+    
+    def test_calculate_rfm_top_and_dist(self):
+        """Test top customer and segment distribution views"""
+        orders = self.etl.extract_orders('2024-01-01', '2024-12-31')
+        
+        top, distribution, total = self.etl.calculate_rfm_top_and_dist(orders, limit=5)
+        self.assertEqual(len(top), 5)
+        self.assertTrue(top['monetary'].is_monotonic_decreasing)
+        self.assertEqual(sum(distribution.values()), total)
+        self.assertEqual(total, orders['customer_id'].nunique())
+        
+        top, distribution, total = self.etl.calculate_rfm_top_and_dist(orders, segment='Champions')
+        self.assertTrue((top['segment'] == 'Champions').all())
+        self.assertEqual(distribution['Champions'], total)
     
     def test_rfm_segment_assignment(self):
         """Test RFM segment assignment logic"""
-        # Test Champions segment
-        row_champions = pd.Series({'r_score': 5, 'f_score': 5, 'm_score': 5})
-        segment = self.etl._assign_rfm_segment(row_champions)
-        self.assertEqual(segment, 'Champions')
-        
-        # Test Lost Customers segment
-        row_lost = pd.Series({'r_score': 1, 'f_score': 1, 'm_score': 1})
-        segment = self.etl._assign_rfm_segment(row_lost)
-        self.assertEqual(segment, 'Lost Customers')
-        
-        # Test At Risk segment
-        row_at_risk = pd.Series({'r_score': 1, 'f_score': 4, 'm_score': 4})
-        segment = self.etl._assign_rfm_segment(row_at_risk)
-        self.assertEqual(segment, 'At Risk')
+        # Champions, Lost Customers, At Risk, Potential Loyalists, Regular Customers
+        r = np.array([5, 1, 1, 3, 3])
+        f = np.array([5, 1, 4, 2, 3])
+        m = np.array([5, 1, 4, 5, 2])
+        
+        codes = self.etl._assign_rfm_segments(r, f, m)
+        self.assertEqual([RFM_SEGMENTS[code] for code in codes], [
+            'Champions', 'Lost Customers', 'At Risk', 'Potential Loyalists', 'Regular Customers'
+        ])
     
     def test_analyze_product_affinity(self):
         """Test product affinity analysis"""
@@ -146,6 +235,38 @@ class TestEcommerceETL(unittest.TestCase):
             self.assertTrue((affinity['support'] >= 0).all())
             self.assertTrue((affinity['support'] <= 1).all())
     
+    def test_analyze_product_affinity_pruning(self):
+        """Test support threshold and top-k pushdown in product affinity"""
+        order_items = pd.DataFrame({
+            'order_id': ['ORD-001', 'ORD-001', 'ORD-002', 'ORD-002', 'ORD-003', 'ORD-003'],
+            'product_id': ['PROD-A', 'PROD-B', 'PROD-A', 'PROD-B', 'PROD-A', 'PROD-C']
+        })
+        
+        # PROD-A/PROD-B co-occur in 2 of 50 orders, PROD-A/PROD-C in 1
+        affinity = self.etl.analyze_product_affinity(
+            self.sample_orders, order_items, min_support=0.03
+        )
+        self.assertEqual(len(affinity), 1)
+        self.assertEqual(affinity.attrs['total_pairs'], 1)
+        self.assertEqual(affinity.iloc[0]['co_occurrence_count'], 2)
+        
+        affinity = self.etl.analyze_product_affinity(self.sample_orders, order_items, top_k=1)
+        self.assertEqual(len(affinity), 1)
+        self.assertEqual(affinity.attrs['total_pairs'], 2)
+        self.assertEqual(affinity.iloc[0]['product_b'], 'PROD-B')
+    
+    def test_analyze_product_affinity_unordered_pairs(self):
+        """Test that a pair counts the same regardless of item order"""
+        order_items = pd.DataFrame({
+            'order_id': ['ORD-001', 'ORD-001', 'ORD-002', 'ORD-002'],
+            'product_id': ['PROD-A', 'PROD-B', 'PROD-B', 'PROD-A']
+        })
+        
+        affinity = self.etl.analyze_product_affinity(self.sample_orders, order_items)
+        self.assertEqual(len(affinity), 1)
+        self.assertEqual(affinity.iloc[0]['product_a'], 'PROD-A')
+        self.assertEqual(affinity.iloc[0]['co_occurrence_count'], 2)
+    
     def test_calculate_conversion_funnel(self):
         """Test conversion funnel calculation"""
         funnel = self.etl.calculate_conversion_funnel(self.sample_events)
@@ -180,6 +301,21 @@ class TestEcommerceETL(unittest.TestCase):
         self.assertTrue((cohorts >= 0).all().all())
         self.assertTrue((cohorts <= 100).all().all())
     
+    def test_analyze_cohorts_month_offsets(self):
+        """Test months since first purchase across a year boundary"""
+        orders = pd.DataFrame({
+            'order_id': ['ORD-001', 'ORD-002', 'ORD-003', 'ORD-004'],
+            'customer_id': ['CUST-001', 'CUST-001', 'CUST-002', 'CUST-002'],
+            'order_date': pd.to_datetime(['2023-12-30', '2024-02-01', '2024-01-01', '2024-01-31']),
+            'order_total': [100.0, 50.0, 75.0, 25.0]
+        })
+        
+        cohorts = self.etl.analyze_cohorts(orders)
+        self.assertEqual([str(p) for p in cohorts.index], ['2023-12', '2024-01'])
+        self.assertEqual(cohorts.columns.tolist(), [0, 2])
+        self.assertEqual(cohorts.loc['2023-12', 2], 100)
+        self.assertTrue(np.isnan(cohorts.loc['2024-01', 2]))
+    
     def test_run_full_pipeline(self):
         """Test complete ETL pipeline"""
         results = self.etl.run_full_pipeline('2024-01-01', '2024-12-31')
@@ -213,7 +349,7 @@ class TestDataQuality(unittest.TestCase):
     """Test data quality checks"""
     
     def setUp(self):
-        self.config = {'batch_size': 1000}
+        self.config = {'batch_size': 1000, 'sample_cache_dir': SAMPLE_CACHE_DIR}
         self.etl = EcommerceETL(self.config)
     
     def test_no_duplicate_events(self):